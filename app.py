@@ -1,54 +1,448 @@
-from flask import Flask, render_template
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 from flask_sock import Sock
+import os
 import json
 import time
+import resource
+import sys
+import itertools
 import threading
+import urllib.error
+import urllib.request
+from collections import deque
 from simulation import SwarmSimulation
+from checkpoint import Checkpointer, restore_checkpoint
+from recording import (CHUNK_HEADER, MAX_CHUNK_BYTES, RecordingError, UploadSpool,
+                       iter_chunks, parse_frame_range)
+from relay import FramePublisher, FrameSubscriber
+from persistence import db, database_uri, WriteBehindWriter, recent_runs, run_details
 
 app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(os.environ.get('DATABASE_URL'))
 sock = Sock(app)
+db.init_app(app)
+
+@app.cli.command('init-db')
+def init_db():
+    """Create the database tables"""
+    db.create_all()
+    print("Database tables created")
+
+# Process role:
+#   standalone - simulation and viewers in this process (default)
+#   host       - as standalone, and also publishes frames to front ends over the relay socket
+#   frontend   - no simulation; serves viewers from frames relayed by the host, so
+#                any number of front-end workers can share one simulation
+SWARM_ROLE = os.environ.get('SWARM_ROLE', 'standalone')
+RELAY_SOCKET = os.environ.get('SWARM_RELAY_SOCKET', '/tmp/swarm-relay.sock')
+# Where front ends fetch recordings from; the host serves /recording itself
+SWARM_HOST_URL = os.environ.get('SWARM_HOST_URL', 'http://127.0.0.1:5000')
 
-# Initialize simulation
-simulation = SwarmSimulation()
 connected_clients = set()
+relay_clients = {}  # client id -> ws, for routing replies relayed from the host
+_client_ids = itertools.count(1)
+pending_replies = deque()  # (reply, message) queued by the simulation thread
+
+CHECKPOINT_PATH = os.environ.get('SWARM_CHECKPOINT', 'swarm_checkpoint.bin')
+CHECKPOINT_INTERVAL = float(os.environ.get('SWARM_CHECKPOINT_INTERVAL', 30))
+
+# Background services, created by start_services() from the entry points
+simulation = None
+checkpointer = None
+writer = None
+publisher = None
+relay = None
+
+upload_spool = UploadSpool(os.environ.get('SWARM_UPLOAD_DIR', 'recording_uploads'))
+
+def _rss_kb():
+    """Resident set size of this process in KiB and whether it is 'current' or 'peak'.
+
+    Without /proc (e.g. macOS) only the peak is available, from ru_maxrss,
+    which is reported in bytes on macOS and in KiB elsewhere.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() // 1024, 'current'
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            peak //= 1024
+        return peak, 'peak'
+
+def send_to_clients(message: str):
+    """Send an encoded message to every connected client"""
+    disconnected = set()
+    for ws in list(connected_clients):
+        try:
+            ws.send(message)
+        except Exception as e:
+            print(f"Failed to send to client: {e}")
+            disconnected.add(ws)
+    
+    # Remove disconnected clients
+    connected_clients.difference_update(disconnected)
 
 def broadcast_state():
     """Broadcast simulation state to all connected clients"""
+    frame = 0
     while True:
-        if connected_clients:
+        flush_pending_replies()
+        if connected_clients or (publisher and publisher.subscriber_count):
+            frame += 1
             state = {
                 'type': 'state_update',
+                'frame': frame,
+                'tick': simulation.tick,
+                'timestamp': simulation.tick_time,
                 'agents': simulation.get_agent_states(),
                 'analytics': simulation.get_analytics()
             }
             message = json.dumps(state)
             
-            # Broadcast to all clients
-            disconnected = set()
-            for ws in connected_clients:
-                try:
-                    ws.send(message)
-                except Exception as e:
-                    print(f"Failed to send to client: {e}")
-                    disconnected.add(ws)
-            
-            # Remove disconnected clients
-            connected_clients.difference_update(disconnected)
+            # Broadcast to local clients and relay subscribers
+            if publisher:
+                publisher.publish(message)
+            send_to_clients(message)
             
         time.sleep(1/30)  # 30 FPS update rate
 
-# Start broadcast thread
-broadcast_thread = threading.Thread(target=broadcast_state)
-broadcast_thread.daemon = True
-broadcast_thread.start()
+def _simulation_command(data):
+    """Callable that applies a command message, or None for unknown actions"""
+    action = data['action']
+    if action == 'start_playback':
+        recording = None
+        if 'upload_id' in data:
+            try:
+                recording = upload_spool.take(data['upload_id'])
+            except (RecordingError, OSError) as e:
+                print(f"Failed to open uploaded recording: {e}")
+        elif 'recording' in data:
+            recording = data['recording']
+
+        def start_playback():
+            if recording is not None:
+                simulation.load_recording(recording)
+            simulation.start_playback()
+        return start_playback
+
+    return {
+        'start': simulation.start,
+        'stop': simulation.stop,
+        'reset': simulation.reset,
+        'start_recording': simulation.start_recording,
+        'stop_recording': simulation.stop_recording,
+        'stop_playback': simulation.stop_playback
+    }.get(action)
+
+def handle_message(data, reply, relayed=False):
+    """Queue a client control message for the next tick boundary.
+
+    Messages that change simulation state are applied by the simulation
+    thread between ticks and acknowledged with the tick they were applied
+    at; reply(dict) answers the sender and is deferred to the broadcast
+    thread so the tick loop never blocks on a socket. relayed is True for
+    messages from front ends, whose replies must fit in one relay message.
+    """
+    def acknowledge(result, tick, coalesced, latency):
+        pending_replies.append((reply, {
+            'type': 'ack',
+            'id': data.get('id'),
+            'command': data['type'],
+            'name': data.get('name', data.get('action')),
+            'tick': tick,
+            'coalesced': coalesced,
+            'latency_ms': round(latency * 1000, 2)
+        }))
+
+    if data['type'] == 'command':
+        apply = _simulation_command(data)
+        if apply is not None:
+            simulation.commands.submit(('command', data['action']), apply, acknowledge)
+            
+    elif data['type'] == 'parameter':
+        name, value = data['name'], data['value']
+        # Slider drags send bursts; only the latest value per tick is applied
+        simulation.commands.submit(('parameter', name),
+                                   lambda: simulation.set_parameter(name, value),
+                                   acknowledge, coalesce=True)
+        
+    elif data['type'] == 'pattern':
+        simulation.commands.submit(('pattern',), lambda: simulation.set_pattern(data['name']),
+                                   acknowledge)
+        
+    elif data['type'] == 'custom_behavior':
+        if data['action'] == 'save':
+            def save_behavior():
+                success, message = simulation.set_custom_behavior(data['code'])
+                if success:
+                    simulation.set_pattern('custom')
+                return success, message
+
+            def respond(result, tick, coalesced, latency):
+                success, message = result or (False, 'Failed to apply behavior')
+                pending_replies.append((reply, {
+                    'type': 'behavior_response',
+                    'success': success,
+                    'message': message
+                }))
+                acknowledge(result, tick, coalesced, latency)
+
+            simulation.commands.submit(('custom_behavior',), save_behavior, respond)
+        elif data['action'] == 'test':
+            success, message = simulation.validate_custom_behavior(data['code'])
+            reply({
+                'type': 'behavior_response',
+                'success': success,
+                'message': message
+            })
+            
+    elif data['type'] == 'get_recording':
+        if relayed:
+            # A whole recording can exceed a relay message; point at the stream
+            reply({'type': 'recording_data', 'url': '/recording'})
+        else:
+            reply({
+                'type': 'recording_data',
+                'recording': simulation.save_recording()
+            })
+
+def flush_pending_replies():
+    """Send replies queued by the simulation thread"""
+    while pending_replies:
+        reply, message = pending_replies.popleft()
+        try:
+            reply(message)
+        except Exception as e:
+            print(f"Failed to send reply to client: {e}")
+
+def _deliver_relayed_reply(client_id, message):
+    """Route a reply from the host to the front-end client that asked"""
+    ws = relay_clients.get(client_id)
+    if ws is not None:
+        try:
+            ws.send(json.dumps(message))
+        except Exception as e:
+            print(f"Failed to send to client: {e}")
+
+def start_services():
+    """Start the simulation and its background threads for this process's role.
+
+    Called by the entry points (main.py, wsgi.py) in the process that serves
+    requests, never on import, so tools like 'flask init-db' and the debug
+    reloader's watcher process do not start a second simulation.
+    """
+    global simulation, checkpointer, writer, publisher, relay
+
+    if simulation is not None or relay is not None:
+        return
+    if SWARM_ROLE == 'frontend':
+        relay = FrameSubscriber(RELAY_SOCKET, on_frame=send_to_clients,
+                                on_reply=_deliver_relayed_reply)
+        relay.start()
+        return
+
+    # Initialize simulation
+    simulation = SwarmSimulation()
+
+    # Restore the last checkpoint (if any) and keep checkpointing in the background
+    if CHECKPOINT_PATH:
+        restore_checkpoint(simulation, CHECKPOINT_PATH)
+        checkpointer = Checkpointer(simulation, CHECKPOINT_PATH, CHECKPOINT_INTERVAL)
+        checkpointer.start()
+
+    # Persist runs, run events and analytics samples without blocking the tick loop;
+    # only the simulation process creates tables, front ends just read them
+    with app.app_context():
+        db.create_all()
+    writer = WriteBehindWriter(app)
+    writer.start()
+    simulation.event_sink = writer.handle_event
+    writer.handle_event(simulation.run_id, 'run_started', simulation.run_info())
+
+    if SWARM_ROLE == 'host':
+        publisher = FramePublisher(RELAY_SOCKET, on_command=lambda data, reply:
+                                   handle_message(data, reply, relayed=True))
+        publisher.start()
+
+    # Start broadcast thread
+    broadcast_thread = threading.Thread(target=broadcast_state)
+    broadcast_thread.daemon = True
+    broadcast_thread.start()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/metrics')
+def metrics():
+    """Report server resource usage for load testing"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    rss_kb, rss_kind = _rss_kb()
+    report = {
+        'role': SWARM_ROLE,
+        'wall_time': time.time(),
+        'cpu_time': usage.ru_utime + usage.ru_stime,
+        'rss_kb': rss_kb,
+        'rss_kind': rss_kind,
+        'clients': len(connected_clients)
+    }
+    if simulation:
+        report['tick'] = simulation.tick
+        report['multirate'] = simulation.scheduler.stats()
+        report['persistence'] = writer.stats()
+        report['commands'] = simulation.commands.stats()
+    if publisher:
+        report['relay'] = publisher.stats()
+    if relay:
+        report['relay_connected'] = relay.connected
+    return jsonify(report)
+
+@app.route('/runs')
+def list_runs():
+    """List past runs, most recent first"""
+    limit = min(max(1, request.args.get('limit', 50, type=int)), 500)
+    return jsonify(recent_runs(limit, request.args.get('pattern')))
+
+@app.route('/runs/<run_id>')
+def get_run(run_id):
+    """A past run with its events and analytics samples"""
+    run = run_details(run_id, since_tick=request.args.get('since_tick', 0, type=int))
+    if run is None:
+        return jsonify({'error': 'Unknown run'}), 404
+    return jsonify(run)
+
+@app.route('/recording')
+def download_recording():
+    """Stream the current recording as compressed chunks.
+
+    Supports 'Range: frames=a-b' (or ?start=&end= frame indices) so an
+    interrupted download can resume from the last complete chunk. The ETag
+    names the recording; a resume whose If-Range no longer matches (a new
+    recording was started) gets the whole new recording instead.
+    """
+    if simulation is None:
+        return _proxy_recording_to_host()
+    # Re-read if start_recording swapped the recording in between
+    while True:
+        recording_id = simulation.recording_id
+        states = simulation.save_recording()
+        if recording_id == simulation.recording_id:
+            break
+    total = len(states)
+    etag = f'"{recording_id}"'
+    # Frames are only ever appended to a recording, so its earlier frames
+    # stay byte-identical while it grows and the ETag can stay strong.
+    if request.headers.get('If-Range', etag) != etag:
+        frame_range = (0, total)
+    else:
+        try:
+            frame_range = parse_frame_range(request.headers.get('Range'), total)
+        except RecordingError as e:
+            return Response(str(e), status=416, headers={'Content-Range': f'frames */{total}',
+                                                         'ETag': etag})
+    if frame_range is None:
+        start = min(max(0, request.args.get('start', 0, type=int)), total)
+        end = min(max(start, request.args.get('end', total, type=int)), total)
+        if start == end and total:
+            return Response('Range not satisfiable', status=416,
+                            headers={'Content-Range': f'frames */{total}', 'ETag': etag})
+        frame_range = (start, end)
+    start, end = frame_range
+
+    headers = {
+        'Accept-Ranges': 'frames',
+        'X-Recording-Frames': str(total),
+        'ETag': etag,
+        'Content-Disposition': 'attachment; filename="swarm-recording.swrec"'
+    }
+    status = 200
+    if (start, end) != (0, total):
+        status = 206
+        headers['Content-Range'] = f'frames {start}-{max(start, end - 1)}/{total}'
+    return Response(stream_with_context(iter_chunks(states, start, end)), status=status,
+                    mimetype='application/octet-stream', headers=headers)
+
+_PROXIED_RECORDING_HEADERS = ('Content-Type', 'Accept-Ranges', 'X-Recording-Frames', 'ETag',
+                              'Content-Range', 'Content-Disposition')
+
+def _proxy_recording_to_host():
+    """Stream /recording from the simulation host (front-end role)"""
+    url = SWARM_HOST_URL.rstrip('/') + '/recording'
+    if request.query_string:
+        url += '?' + request.query_string.decode('latin-1')
+    upstream_request = urllib.request.Request(url)
+    for name in ('Range', 'If-Range'):
+        if name in request.headers:
+            upstream_request.add_header(name, request.headers[name])
+    try:
+        upstream = urllib.request.urlopen(upstream_request, timeout=10)
+    except urllib.error.HTTPError as e:
+        upstream = e  # pass the host's 416 etc. through unchanged
+    except OSError as e:
+        print(f"Failed to fetch recording from host: {e}")
+        return jsonify({'error': 'Simulation host unavailable'}), 502
+
+    def stream():
+        with upstream:
+            while True:
+                block = upstream.read(64 * 1024)
+                if not block:
+                    break
+                yield block
+
+    headers = {name: upstream.headers[name] for name in _PROXIED_RECORDING_HEADERS
+               if name in upstream.headers}
+    return Response(stream(), status=upstream.getcode(), headers=headers)
+
+@app.route('/recording/uploads', methods=['POST'])
+def create_recording_upload():
+    """Start a chunked recording upload"""
+    return jsonify({'upload_id': upload_spool.create(), 'frames': 0}), 201
+
+def _read_chunk_body():
+    """Read a PUT body of at most one chunk, or None if it is larger.
+
+    Reads the stream itself rather than trusting Content-Length, which a
+    chunked Transfer-Encoding request does not send.
+    """
+    limit = CHUNK_HEADER.size + MAX_CHUNK_BYTES
+    if (request.content_length or 0) > limit:
+        return None
+    parts = []
+    size = 0
+    while size <= limit:
+        part = request.stream.read(min(64 * 1024, limit + 1 - size))
+        if not part:
+            return b''.join(parts)
+        parts.append(part)
+        size += len(part)
+    return None
+
+@app.route('/recording/uploads/<upload_id>', methods=['GET', 'PUT'])
+def recording_upload(upload_id):
+    """Report committed frames (GET) or append one chunk (PUT)"""
+    try:
+        if not upload_spool.exists(upload_id):
+            return jsonify({'error': 'Unknown upload'}), 404
+        if request.method == 'GET':
+            return jsonify({'upload_id': upload_id, 'frames': upload_spool.frame_count(upload_id)})
+        chunk = _read_chunk_body()
+        if chunk is None:
+            return jsonify({'error': 'Chunk too large'}), 413
+        frames = upload_spool.append(upload_id, chunk)
+        return jsonify({'upload_id': upload_id, 'frames': frames})
+    except FileNotFoundError:
+        return jsonify({'error': 'Unknown upload'}), 404
+    except RecordingError as e:
+        return jsonify({'error': str(e)}), 409
+
 @sock.route('/ws')
 def websocket(ws):
     """Handle WebSocket connections"""
+    client_id = next(_client_ids)
+    relay_clients[client_id] = ws
     connected_clients.add(ws)
     print(f"Client connected. Total clients: {len(connected_clients)}")
     
@@ -56,58 +450,14 @@ def websocket(ws):
         while True:
             message = ws.receive()
             data = json.loads(message)
-            
-            if data['type'] == 'command':
-                if data['action'] == 'start':
-                    simulation.start()
-                elif data['action'] == 'stop':
-                    simulation.stop()
-                elif data['action'] == 'reset':
-                    simulation.reset()
-                elif data['action'] == 'start_recording':
-                    simulation.start_recording()
-                elif data['action'] == 'stop_recording':
-                    simulation.stop_recording()
-                elif data['action'] == 'start_playback':
-                    if 'recording' in data:
-                        simulation.load_recording(data['recording'])
-                    simulation.start_playback()
-                elif data['action'] == 'stop_playback':
-                    simulation.stop_playback()
-                    
-            elif data['type'] == 'parameter':
-                simulation.set_parameter(data['name'], data['value'])
-                
-            elif data['type'] == 'pattern':
-                simulation.set_pattern(data['name'])
-                
-            elif data['type'] == 'custom_behavior':
-                if data['action'] == 'save':
-                    success, message = simulation.set_custom_behavior(data['code'])
-                    if success:
-                        simulation.set_pattern('custom')
-                    ws.send(json.dumps({
-                        'type': 'behavior_response',
-                        'success': success,
-                        'message': message
-                    }))
-                elif data['action'] == 'test':
-                    success, message = simulation.validate_custom_behavior(data['code'])
-                    ws.send(json.dumps({
-                        'type': 'behavior_response',
-                        'success': success,
-                        'message': message
-                    }))
-                    
-            elif data['type'] == 'get_recording':
-                recording = simulation.save_recording()
-                ws.send(json.dumps({
-                    'type': 'recording_data',
-                    'recording': recording
-                }))
+            if relay:
+                relay.send_command(client_id, data)
+            else:
+                handle_message(data, lambda reply: ws.send(json.dumps(reply)))
                 
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        connected_clients.remove(ws)
-        print(f"Client disconnected. Remaining clients: {len(connected_clients)}")
\ No newline at end of file
+        connected_clients.discard(ws)
+        relay_clients.pop(client_id, None)
+        print(f"Client disconnected. Remaining clients: {len(connected_clients)}")
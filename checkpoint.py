@@ -0,0 +1,275 @@
+"""Binary checkpoint / restore of the full SwarmSimulation state.
+
+File layout (little endian):
+
+    b'SWCK' | u16 version | u32 header length | zlib(JSON header)
+    agent block  (float64 columns, see pack_columns)
+    one float32 agent block per recorded frame
+
+The header holds the scalar state (parameters, pattern, formation centre,
+accumulated time, custom behavior, analytics, recording flag); agent data is
+stored as packed column arrays so restore is a handful of ``frombytes`` calls.
+"""
+import json
+import logging
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from simulation import Agent, SwarmSimulation
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SWCK'
+VERSION = 1
+
+ROLES = ('normal', 'predator', 'prey')
+STATES = ('normal', 'organized')
+_ROLE_CODES = {name: code for code, name in enumerate(ROLES)}
+_STATE_CODES = {name: code for code, name in enumerate(STATES)}
+
+_BLOCK_HEADER = struct.Struct('<I')
+_HEADER_KEYS = frozenset(('tick', 'time_accumulated', 'running', 'current_pattern', 'parameters',
+                          'formation_center', 'custom_behavior', 'analytics', 'recording',
+                          'recorded_frames'))
+
+
+def pack_columns(xs, ys, angles, roles, states, typecode: str = 'd', extra=()) -> bytes:
+    """Pack agent columns as u32 count, float columns then u8 role/state codes"""
+    parts = [_BLOCK_HEADER.pack(len(xs))]
+    for column in (xs, ys, angles, *extra):
+        parts.append(array(typecode, column).tobytes())
+    parts.append(bytes(_ROLE_CODES.get(r, 0) for r in roles))
+    parts.append(bytes(_STATE_CODES.get(s, 0) for s in states))
+    return b''.join(parts)
+
+
+def unpack_columns(buf, offset: int = 0, typecode: str = 'd',
+                   extra: int = 0) -> Tuple[List, int]:
+    """Inverse of pack_columns; returns (columns, offset after the block).
+
+    Raises ValueError if buf is too short for the count in the block header
+    and IndexError for unknown role/state codes.
+    """
+    (n,) = _BLOCK_HEADER.unpack_from(buf, offset)
+    offset += _BLOCK_HEADER.size
+    width = array(typecode).itemsize * n
+    if offset + (3 + extra) * width + 2 * n > len(buf):
+        raise ValueError(f"Truncated agent block: header claims {n} agents")
+    columns = []
+    for _ in range(3 + extra):
+        column = array(typecode)
+        column.frombytes(buf[offset:offset + width])
+        columns.append(column)
+        offset += width
+    columns.append([ROLES[c] for c in buf[offset:offset + n]])
+    offset += n
+    columns.append([STATES[c] for c in buf[offset:offset + n]])
+    offset += n
+    return columns, offset
+
+
+def pack_states(states: List[Dict], typecode: str = 'f') -> bytes:
+    """Pack one recorded frame (list of agent dicts) as a column block"""
+    return pack_columns([a['x'] for a in states], [a['y'] for a in states],
+                        [a['angle'] for a in states],
+                        [a.get('role', 'normal') for a in states],
+                        [a.get('state', 'normal') for a in states], typecode)
+
+
+def unpack_states(buf, offset: int = 0, typecode: str = 'f') -> Tuple[List[Dict], int]:
+    """Inverse of pack_states"""
+    (xs, ys, angles, roles, states), offset = unpack_columns(buf, offset, typecode)
+    frame = [{'x': x, 'y': y, 'angle': a, 'role': r, 'state': s}
+             for x, y, a, r, s in zip(xs, ys, angles, roles, states)]
+    return frame, offset
+
+
+def take_snapshot(simulation: SwarmSimulation) -> Dict:
+    """Copy the simulation state; must run on the simulation thread between ticks.
+
+    Agents are copied into plain tuples and the recording list is copied
+    shallowly (recorded frames are never mutated once appended), so the
+    expensive encoding and file I/O can happen on another thread.
+    """
+    analytics = simulation.analytics
+    return {
+        'created': time.time(),
+        'tick': simulation.tick,
+        'run_id': simulation.run_id,
+        'time_accumulated': simulation.time_accumulated,
+        'running': simulation.running,
+        'current_pattern': simulation.current_pattern,
+        'parameters': dict(simulation.parameters),
+        'formation_center': dict(simulation.formation_center),
+        'custom_behavior': getattr(simulation, 'custom_behavior', None),
+        'analytics': {
+            'avg_distance': analytics.avg_distance,
+            'role_counts': dict(analytics.role_counts),
+            'pattern_durations': dict(analytics.pattern_durations),
+            'pattern_switches': analytics.pattern_switches,
+            'cohesion_score': analytics.cohesion_score,
+            'alignment_score': analytics.alignment_score,
+            'interaction_zones': dict(analytics.interaction_zones),
+        },
+        'recording': simulation.recording,
+        'agents': [(a.x, a.y, a.angle, a.vx, a.vy, a.role, a.state) for a in simulation.agents],
+        'recorded_states': list(simulation.recorded_states),
+    }
+
+
+def encode_snapshot(snapshot: Dict) -> bytes:
+    """Serialize a snapshot taken with take_snapshot"""
+    agents = snapshot['agents']
+    recorded = snapshot['recorded_states']
+    header = {k: v for k, v in snapshot.items() if k not in ('agents', 'recorded_states')}
+    header['recorded_frames'] = len(recorded)
+    header_bytes = zlib.compress(json.dumps(header).encode('utf-8'))
+
+    columns = list(zip(*agents)) if agents else [()] * 7
+    parts = [
+        MAGIC,
+        struct.pack('<HI', VERSION, len(header_bytes)),
+        header_bytes,
+        pack_columns(columns[0], columns[1], columns[2], columns[5], columns[6],
+                     'd', extra=(columns[3], columns[4])),
+    ]
+    parts.extend(pack_states(frame) for frame in recorded)
+    return b''.join(parts)
+
+
+def write_checkpoint(snapshot: Dict, path: str):
+    """Atomically write a snapshot to path"""
+    data = encode_snapshot(snapshot)
+    # A unique temporary file in the same directory, so concurrent writers
+    # never share it and os.replace stays on one filesystem.
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.',
+                                    suffix='.tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    logger.info(f"Checkpoint written to {path} ({len(data)} bytes, tick {snapshot['tick']})")
+
+
+def restore_checkpoint(simulation: SwarmSimulation, path: str) -> bool:
+    """Load a checkpoint file into simulation.
+
+    Returns False, leaving the simulation untouched, if the file is missing
+    or cannot be decoded, so a bad checkpoint never stops the server starting.
+    """
+    try:
+        with open(path, 'rb') as f:
+            buf = memoryview(f.read())
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.error(f"Failed to read checkpoint {path}: {e}")
+        return False
+
+    if bytes(buf[:4]) != MAGIC:
+        logger.error(f"Not a swarm checkpoint: {path}")
+        return False
+    try:
+        version, header_len = struct.unpack_from('<HI', buf, 4)
+        if version != VERSION:
+            logger.error(f"Unsupported checkpoint version {version} in {path}")
+            return False
+        offset = 4 + struct.calcsize('<HI')
+        header = json.loads(zlib.decompress(buf[offset:offset + header_len]))
+        offset += header_len
+        missing = _HEADER_KEYS - header.keys()
+        if missing:
+            raise KeyError(', '.join(sorted(missing)))
+
+        (xs, ys, angles, vxs, vys, roles, states), offset = unpack_columns(buf, offset, 'd', extra=2)
+        agents = list(map(Agent, xs, ys, angles, vxs, vys, roles, states))
+        recorded = []
+        for _ in range(header['recorded_frames']):
+            frame, offset = unpack_states(buf, offset)
+            recorded.append(frame)
+    except (struct.error, zlib.error, ValueError, IndexError, KeyError, TypeError) as e:
+        logger.error(f"Corrupt checkpoint {path}, starting from a fresh swarm: {e}")
+        return False
+
+    simulation.stop_playback()
+    simulation.parameters.update(header['parameters'])
+    simulation.current_pattern = header['current_pattern']
+    simulation.formation_center = header['formation_center']
+    simulation.time_accumulated = header['time_accumulated']
+    simulation.tick = header['tick']
+    simulation.run_id = header.get('run_id') or simulation.run_id
+    simulation.last_pattern_change = time.time()
+    if header['custom_behavior']:
+        simulation.set_custom_behavior(header['custom_behavior'])
+    for name, value in header['analytics'].items():
+        setattr(simulation.analytics, name, value)
+    simulation.recorded_states = recorded
+    simulation.recording = header['recording']
+    simulation.agents = agents
+    simulation.running = header['running']
+    logger.info(f"Restored {len(agents)} agents from checkpoint {path} (tick {header['tick']})")
+    return True
+
+
+class Checkpointer(threading.Thread):
+    """Periodically checkpoints a simulation without blocking its tick loop.
+
+    The snapshot copy is taken on the simulation thread at a tick boundary,
+    submitted through the simulation's command queue like any other
+    control message; encoding and writing happen here.
+    """
+
+    def __init__(self, simulation: SwarmSimulation, path: str, interval: float = 30.0):
+        super().__init__(daemon=True)
+        self.simulation = simulation
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def checkpoint_now(self, timeout: float = 5.0) -> Optional[Dict]:
+        """Request a snapshot at the next tick boundary and write it"""
+        # Each request gets its own slot so a snapshot that arrives after
+        # its request timed out is simply dropped instead of being written
+        # by a later request, and the simulation thread never blocks on it.
+        slot: "queue.Queue[Dict]" = queue.Queue(maxsize=1)
+        abandoned = threading.Event()
+
+        def capture():
+            if not abandoned.is_set():
+                return take_snapshot(self.simulation)
+
+        def on_applied(snapshot, tick, coalesced, latency):
+            if snapshot is not None and not abandoned.is_set():
+                slot.put_nowait(snapshot)
+
+        self.simulation.commands.submit(('checkpoint',), capture, on_applied)
+        try:
+            snapshot = slot.get(timeout=timeout)
+        except queue.Empty:
+            abandoned.set()
+            logger.warning("Timed out waiting for simulation snapshot")
+            return None
+        try:
+            write_checkpoint(snapshot, self.path)
+        except OSError as e:
+            logger.error(f"Failed to write checkpoint {self.path}: {e}")
+        return snapshot
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.checkpoint_now()
@@ -0,0 +1,106 @@
+"""Tick-boundary command queue for simulation control messages.
+
+Connection threads submit commands; the simulation thread drains the queue
+between ticks, so control messages never run in the middle of a tick.
+Coalescible commands (parameter updates) with the same key that are still
+pending are merged, so a burst of slider messages costs one application per
+tick while every sender still gets an acknowledgment.
+
+This is the only way to run work on the simulation thread between ticks;
+checkpoint snapshots are submitted here too.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from percentiles import summarize
+
+# on_applied(result, tick, coalesced, latency_seconds)
+AppliedCallback = Callable[[Any, int, bool, float], None]
+
+logger = logging.getLogger(__name__)
+
+
+class _Command:
+    __slots__ = ('key', 'apply', 'coalesce', 'waiters')
+
+    def __init__(self, key: Hashable, apply: Callable[[], Any], coalesce: bool,
+                 on_applied: Optional[AppliedCallback], received_at: float):
+        self.key = key
+        self.apply = apply
+        self.coalesce = coalesce
+        self.waiters = [(on_applied, received_at)]
+
+
+class CommandQueue:
+    def __init__(self, latency_window: int = 1000):
+        self._pending: List[_Command] = []
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self.submitted = 0
+        self.applied = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, key: Hashable, apply: Callable[[], Any],
+               on_applied: Optional[AppliedCallback] = None, coalesce: bool = False):
+        """Queue apply() to run at the next tick boundary.
+
+        With coalesce=True, a pending command with the same key is replaced
+        as long as only other coalescible commands were queued after it, so
+        ordering relative to non-coalescible commands is preserved.
+        """
+        received_at = time.time()
+        with self._lock:
+            self.submitted += 1
+            if coalesce:
+                for command in reversed(self._pending):
+                    if not command.coalesce:
+                        break
+                    if command.key == key:
+                        command.apply = apply
+                        command.waiters.append((on_applied, received_at))
+                        self.coalesced += 1
+                        return
+            self._pending.append(_Command(key, apply, coalesce, on_applied, received_at))
+
+    def drain(self, tick: int) -> int:
+        """Apply every pending command; call on the simulation thread between ticks"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for command in pending:
+            try:
+                result = command.apply()
+            except Exception as e:
+                logger.error(f"Error applying command {command.key}: {e}")
+                result = None
+            applied_at = time.time()
+            self.applied += 1
+            coalesced = len(command.waiters) > 1
+            for on_applied, received_at in command.waiters:
+                latency = applied_at - received_at
+                # stats() iterates the deque from request threads
+                with self._lock:
+                    self._latencies.append(latency)
+                if on_applied is None:
+                    continue
+                try:
+                    on_applied(result, tick, coalesced, latency)
+                except Exception as e:
+                    logger.error(f"Error acknowledging command {command.key}: {e}")
+        return len(pending)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            latencies = list(self._latencies)
+        return {
+            'depth': len(self._pending),
+            'submitted': self.submitted,
+            'applied': self.applied,
+            'coalesced': self.coalesced,
+            'latency_ms': summarize([l * 1000 for l in latencies], points=(50, 95))
+        }
@@ -0,0 +1,252 @@
+"""WebSocket load generator for the swarm server.
+
+Opens N concurrent viewers against ``/ws``, optionally drives them with a mix
+of control messages, and reports frame latency, delivered FPS, dropped/late
+frames and server CPU/memory as percentiles.
+
+    python loadtest.py --clients 50 --duration 30 --chatty 0.2
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from simple_websocket import Client, ConnectionClosed
+
+from percentiles import summarize
+
+logger = logging.getLogger(__name__)
+
+PATTERNS = ['flocking', 'circle', 'scatter', 'predator_prey', 'vortex',
+            'split_merge', 'wave', 'collective_action']
+
+# Relative weights of the control messages a chatty viewer sends; parameter
+# updates dominate because slider drags emit one message per input event.
+MESSAGE_MIX = [
+    ('parameter', 0.8),
+    ('pattern', 0.15),
+    ('command', 0.05),
+]
+
+PARAMETER_RANGES = {
+    'agentSpeed': (1, 10),
+    'swarmCohesion': (1, 10),
+    'swarmAlignment': (1, 10),
+    'waveFrequency': (0.1, 2),
+    'waveAmplitude': (10, 100),
+}
+
+
+@dataclass
+class ViewerStats:
+    frames: int = 0
+    dropped: int = 0
+    late: int = 0
+    sent: int = 0
+    errors: int = 0
+    latencies_ms: List[float] = field(default_factory=list)
+    first_receipt: Optional[float] = None
+    last_receipt: Optional[float] = None
+
+    def fps(self) -> float:
+        if self.frames < 2 or self.first_receipt is None:
+            return 0.0
+        return (self.frames - 1) / max(1e-9, self.last_receipt - self.first_receipt)
+
+
+def _random_message(rng: random.Random) -> Dict:
+    """Draw one control message from the configured mix"""
+    kind = rng.choices([k for k, _ in MESSAGE_MIX], weights=[w for _, w in MESSAGE_MIX])[0]
+    if kind == 'parameter':
+        name = rng.choice(list(PARAMETER_RANGES))
+        low, high = PARAMETER_RANGES[name]
+        return {'type': 'parameter', 'name': name, 'value': round(rng.uniform(low, high), 1)}
+    if kind == 'pattern':
+        return {'type': 'pattern', 'name': rng.choice(PATTERNS)}
+    return {'type': 'command', 'action': rng.choice(['start', 'start_recording', 'stop_recording'])}
+
+
+class Viewer(threading.Thread):
+    """One simulated browser tab connected to /ws"""
+
+    def __init__(self, url: str, deadline: float, late_ms: float,
+                 chatty: float, seed: int):
+        super().__init__(daemon=True)
+        self.url = url
+        self.deadline = deadline
+        self.late_ms = late_ms
+        self.chatty = chatty
+        self.rng = random.Random(seed)
+        self.stats = ViewerStats()
+
+    def run(self):
+        try:
+            ws = Client.connect(self.url)
+        except Exception as e:
+            logger.error(f"Viewer failed to connect: {e}")
+            self.stats.errors += 1
+            return
+
+        last_frame = None
+        last_tick = None
+        try:
+            while time.time() < self.deadline:
+                message = ws.receive(timeout=0.5)
+                if message is None:
+                    continue
+                received = time.time()
+                data = json.loads(message)
+                if data.get('type') != 'state_update':
+                    continue
+
+                self.stats.frames += 1
+                if self.stats.first_receipt is None:
+                    self.stats.first_receipt = received
+                self.stats.last_receipt = received
+
+                # Frames repeat the last tick's timestamp while the simulation
+                # is stopped; only frames carrying a new tick measure latency
+                # (the first frame may be stale, so it only sets the baseline).
+                tick = data.get('tick')
+                if 'timestamp' in data and last_tick is not None and tick != last_tick:
+                    latency = (received - data['timestamp']) * 1000
+                    self.stats.latencies_ms.append(latency)
+                    if latency > self.late_ms:
+                        self.stats.late += 1
+                last_tick = tick
+                frame = data.get('frame')
+                if frame is not None:
+                    if last_frame is not None and frame > last_frame + 1:
+                        self.stats.dropped += frame - last_frame - 1
+                    last_frame = frame
+
+                # Send roughly `chatty` control messages per received frame
+                if self.chatty and self.rng.random() < self.chatty:
+                    ws.send(json.dumps(_random_message(self.rng)))
+                    self.stats.sent += 1
+        except ConnectionClosed:
+            logger.warning("Viewer connection closed by server")
+            self.stats.errors += 1
+        except Exception as e:
+            logger.error(f"Viewer error: {e}")
+            self.stats.errors += 1
+        finally:
+            ws.close()
+
+
+class ServerSampler(threading.Thread):
+    """Polls /metrics to derive server CPU utilisation and memory"""
+
+    def __init__(self, url: str, deadline: float, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.url = url
+        self.deadline = deadline
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_mb: List[float] = []
+        self.rss_kind: Optional[str] = None  # 'current', or 'peak' where the server has no /proc
+
+    def _fetch(self) -> Optional[Dict]:
+        try:
+            with urllib.request.urlopen(self.url, timeout=2) as response:
+                return json.loads(response.read())
+        except Exception as e:
+            logger.warning(f"Failed to sample server metrics: {e}")
+            return None
+
+    def run(self):
+        previous = self._fetch()
+        while time.time() < self.deadline:
+            time.sleep(self.interval)
+            sample = self._fetch()
+            if sample is None:
+                continue
+            self.rss_mb.append(sample['rss_kb'] / 1024)
+            self.rss_kind = sample.get('rss_kind', 'current')
+            if previous is not None:
+                wall = sample['wall_time'] - previous['wall_time']
+                if wall > 0:
+                    self.cpu_percent.append(100 * (sample['cpu_time'] - previous['cpu_time']) / wall)
+            previous = sample
+
+
+def run_load_test(base_url: str, clients: int, duration: float, chatty: float = 0.0,
+                  late_ms: float = 66.0, ramp: float = 0.0, seed: int = 0,
+                  start: bool = True) -> Dict:
+    """Run a load test and return a summary report"""
+    ws_url = base_url.replace('http://', 'ws://').replace('https://', 'wss://').rstrip('/') + '/ws'
+    deadline = time.time() + ramp + duration
+
+    if start:
+        control = Client.connect(ws_url)
+        control.send(json.dumps({'type': 'command', 'action': 'start'}))
+        control.close()
+
+    sampler = ServerSampler(base_url.rstrip('/') + '/metrics', deadline)
+    sampler.start()
+
+    viewers = []
+    for i in range(clients):
+        viewer = Viewer(ws_url, deadline, late_ms, chatty, seed + i)
+        viewer.start()
+        viewers.append(viewer)
+        if ramp:
+            time.sleep(ramp / clients)
+
+    for viewer in viewers:
+        viewer.join(timeout=duration + ramp + 5)
+    sampler.join(timeout=5)
+
+    latencies = [l for v in viewers for l in v.stats.latencies_ms]
+    frames = sum(v.stats.frames for v in viewers)
+    return {
+        'clients': clients,
+        'duration_s': duration,
+        'frames_received': frames,
+        'messages_sent': sum(v.stats.sent for v in viewers),
+        'errors': sum(v.stats.errors for v in viewers),
+        'dropped_frames': sum(v.stats.dropped for v in viewers),
+        'late_frames': sum(v.stats.late for v in viewers),
+        'late_threshold_ms': late_ms,
+        'latency_ms': summarize(latencies),
+        'fps_per_client': summarize([v.stats.fps() for v in viewers if v.stats.frames]),
+        'server_cpu_percent': summarize(sampler.cpu_percent),
+        'server_rss_mb': summarize(sampler.rss_mb),
+        'server_rss_kind': sampler.rss_kind,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the swarm WebSocket endpoint")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Server base URL")
+    parser.add_argument('--clients', type=int, default=10, help="Concurrent viewers")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds to measure")
+    parser.add_argument('--chatty', type=float, default=0.0,
+                        help="Probability per received frame that a viewer sends a control message")
+    parser.add_argument('--late-ms', type=float, default=66.0,
+                        help="Latency above which a frame counts as late")
+    parser.add_argument('--ramp', type=float, default=0.0, help="Seconds over which to open connections")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-start', action='store_true', help="Do not send a start command first")
+    parser.add_argument('--output', help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run_load_test(args.url, args.clients, args.duration, chatty=args.chatty,
+                           late_ms=args.late_ms, ramp=args.ramp, seed=args.seed,
+                           start=not args.no_start)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -1,4 +1,12 @@
-from app import app
+import os
+
+from app import app, start_services
+
+DEBUG = True
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # With the debugger's reloader this script also runs as a file-watching
+    # parent process; only the child that serves requests starts the simulation.
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_services()
+    app.run(host="0.0.0.0", port=5000, debug=DEBUG)
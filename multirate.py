@@ -0,0 +1,221 @@
+"""Adaptive multi-rate stepping for swarm patterns.
+
+Agents in a stable situation (prey well clear of every predator, agents
+already settled on their circle/vortex/formation orbit) only re-run their
+sensing and steering every k ticks, with the steering gain scaled to cover
+the skipped ticks. Between those updates they keep moving along their
+current heading, so motion stays smooth while the expensive part of the
+update (neighbour searches, atan2) is skipped.
+
+The ``multiRateQuality`` parameter controls the trade-off: 1.0 updates every
+agent every tick (identical to the original behavior), lower values allow
+longer strides and looser error tolerances.
+
+    python multirate.py --pattern circle --quality 0.5 --agents 500
+"""
+import argparse
+import copy
+import json
+import logging
+import math
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from percentiles import summarize
+
+logger = logging.getLogger(__name__)
+
+
+class MultiRateScheduler:
+    MAX_STRIDE = 8  # Longest stride allowed at quality 0
+    MAX_TOLERANCE = 0.2  # Steering error (sin of heading error) considered settled at quality 0
+
+    def __init__(self, quality: float = 1.0):
+        self.quality = quality
+        self.tick = 0
+        self.full_updates = 0
+        self.coasted_updates = 0
+
+    @property
+    def max_stride(self) -> int:
+        quality = min(1.0, max(0.0, self.quality))
+        return 1 + int(round((1 - quality) * (self.MAX_STRIDE - 1)))
+
+    @property
+    def tolerance(self) -> float:
+        return (1 - min(1.0, max(0.0, self.quality))) * self.MAX_TOLERANCE
+
+    def begin_tick(self):
+        self.tick += 1
+
+    def due(self, agent) -> int:
+        """Ticks to cover if the agent needs a full update this tick, else 0"""
+        max_stride = self.max_stride
+        if max_stride == 1 or agent.next_update <= self.tick:
+            self.full_updates += 1
+            if agent.last_update < 0:
+                return 1
+            return max(1, min(self.tick - agent.last_update, max_stride))
+        self.coasted_updates += 1
+        return 0
+
+    @staticmethod
+    def reset(agents):
+        """Forget agents' schedules so each gets a full single-tick update next tick.
+
+        Call when the pattern changes: a stride picked under the old pattern
+        says nothing about threats or targets under the new one, and an old
+        last_update would make the first update cover a stale gap.
+        """
+        for agent in agents:
+            agent.last_update = -1
+            agent.next_update = 0
+
+    def schedule(self, agent, stride: int):
+        """Record a full update and pick the tick of the next one"""
+        agent.last_update = self.tick
+        agent.next_update = self.tick + max(1, min(stride, self.max_stride))
+
+    def stride_for_error(self, error: float) -> int:
+        """Stride for an agent whose steering error is error (0 = on target)"""
+        tolerance = self.tolerance
+        if error >= tolerance:
+            return 1
+        return max(1, int(self.max_stride * (1 - error / tolerance)))
+
+    def stride_for_clearance(self, clearance: float, closing_per_tick: float) -> int:
+        """Stride that cannot let a threat close a clearance gap unnoticed"""
+        if clearance <= 0:
+            return 1
+        if closing_per_tick <= 0 or math.isinf(clearance):
+            return self.max_stride
+        return max(1, int(clearance / closing_per_tick))
+
+    @staticmethod
+    def gain(rate: float, steps: int) -> float:
+        """Steering gain equivalent to applying rate for steps consecutive ticks"""
+        if steps == 1:
+            return rate
+        return 1 - (1 - rate) ** steps
+
+    def stats(self) -> Dict:
+        total = self.full_updates + self.coasted_updates
+        return {
+            'quality': self.quality,
+            'max_stride': self.max_stride,
+            'full_updates': self.full_updates,
+            'coasted_updates': self.coasted_updates,
+            'skipped_fraction': round(self.coasted_updates / total, 4) if total else 0.0
+        }
+
+
+def _wrapped_distance(a, b) -> float:
+    dx = abs(a.x - b.x)
+    dy = abs(a.y - b.y)
+    return math.hypot(min(dx, 800 - dx), min(dy, 600 - dy))
+
+
+def _summarize(values: List[float]) -> Dict:
+    return summarize(values, points=(95,), digits=3)
+
+
+def _step(initial_agents: List, parameters: Dict, pattern: str, ticks: int,
+          dt: float, seed: int):
+    """Step a fresh simulation from a deep copy of initial_agents; returns (sim, seconds)"""
+    from simulation import SwarmSimulation
+
+    sim = SwarmSimulation(run_loop=False)
+    sim.parameters = dict(parameters)
+    sim.current_pattern = pattern
+    sim.agents = copy.deepcopy(initial_agents)
+    sim.time_accumulated = 0
+    random.seed(seed)
+    started = time.perf_counter()
+    for _ in range(ticks):
+        sim.time_accumulated += dt
+        sim._update(dt)
+    return sim, time.perf_counter() - started
+
+
+def measure_accuracy(pattern: str, quality: float, agent_count: int = 200,
+                     ticks: int = 600, dt: float = 1 / 60, seed: int = 0,
+                     repeats: int = 3) -> Dict:
+    """Step a full-rate and a multi-rate copy of the same swarm and compare them.
+
+    Both runs start from deep copies of the same initial agents; timings are
+    repeated with the run order alternating and the medians are reported, so
+    neither side benefits from running first.
+
+    Patterns with random jitter (scatter, normal agents in predator_prey)
+    diverge regardless of stepping, so position error is most meaningful
+    for the deterministic patterns.
+    """
+    from simulation import SwarmSimulation
+
+    initial = SwarmSimulation(run_loop=False)
+    initial.parameters['agentCount'] = agent_count
+    random.seed(seed)
+    initial.reset()
+    runs = {
+        'full_rate': dict(initial.parameters, multiRateQuality=1.0),
+        'multi_rate': dict(initial.parameters, multiRateQuality=quality),
+    }
+
+    timings = {name: [] for name in runs}
+    results = {}
+    for repeat in range(max(1, repeats)):
+        order = list(runs) if repeat % 2 == 0 else list(reversed(list(runs)))
+        for name in order:
+            sim, seconds = _step(initial.agents, runs[name], pattern, ticks, dt, seed)
+            timings[name].append(seconds)
+            results.setdefault(name, sim)
+    reference, candidate = results['full_rate'], results['multi_rate']
+    full_rate = statistics.median(timings['full_rate'])
+    multi_rate = statistics.median(timings['multi_rate'])
+
+    pairs = list(zip(reference.agents, candidate.agents))
+    position_errors = [_wrapped_distance(a, b) for a, b in pairs]
+    heading_errors = [abs(math.sin((a.angle - b.angle) / 2)) * 2 for a, b in pairs]
+    by_role = {
+        role: _summarize([e for (a, _), e in zip(pairs, position_errors) if a.role == role])
+        for role in sorted({a.role for a, _ in pairs})
+    }
+    return {
+        'pattern': pattern,
+        'quality': quality,
+        'agents': agent_count,
+        'ticks': ticks,
+        'repeats': max(1, repeats),
+        'position_error': _summarize(position_errors),
+        'heading_error': _summarize(heading_errors),
+        'position_error_by_role': by_role,
+        'scheduler': candidate.scheduler.stats(),
+        'full_rate_seconds': round(full_rate, 4),
+        'multi_rate_seconds': round(multi_rate, 4),
+        'speedup': round(full_rate / max(1e-9, multi_rate), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare multi-rate stepping against full-rate stepping")
+    parser.add_argument('--pattern', default='circle',
+                        choices=['circle', 'vortex', 'predator_prey', 'collective_action'])
+    parser.add_argument('--quality', type=float, nargs='+', default=[1.0, 0.75, 0.5, 0.25, 0.0])
+    parser.add_argument('--agents', type=int, default=200)
+    parser.add_argument('--ticks', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3,
+                        help="Timing runs per side; order alternates and the median is reported")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    for quality in args.quality:
+        report = measure_accuracy(args.pattern, quality, args.agents, args.ticks, seed=args.seed,
+                                  repeats=args.repeats)
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
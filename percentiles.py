@@ -0,0 +1,21 @@
+"""Percentile summaries shared by the load test, multi-rate and command queue reports"""
+import math
+from typing import Dict, Iterable, Sequence
+
+
+def percentile(ordered: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty sequence"""
+    rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(values: Iterable[float], points=(50, 90, 95, 99), digits: int = 2) -> Dict[str, float]:
+    """Nearest-rank percentiles plus min/max/mean of a sample; empty for no values"""
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    result = {f'p{p}': round(percentile(ordered, p), digits) for p in points}
+    result['min'] = round(ordered[0], digits)
+    result['max'] = round(ordered[-1], digits)
+    result['mean'] = round(sum(ordered) / len(ordered), digits)
+    return result
@@ -0,0 +1,335 @@
+"""Write-behind persistence of runs, run events and analytics samples.
+
+The simulation hands events to WriteBehindWriter.handle_event, which only
+appends to in-memory bounded buffers; a background thread drains them and
+writes batched bulk inserts. SQLite is used unless DATABASE_URL points at
+Postgres. A batch that fails because the database is unavailable is put
+back at the front of its buffer and retried with exponential backoff.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import insert, select
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+db = SQLAlchemy()
+
+
+def database_uri(url: Optional[str]) -> str:
+    """Database URI from DATABASE_URL, defaulting to a local SQLite file"""
+    if not url:
+        return 'sqlite:///swarm.db'
+    # Many hosts still hand out the scheme SQLAlchemy dropped in 1.4
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _utc(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).replace(tzinfo=None)
+
+
+class Run(db.Model):
+    __tablename__ = 'runs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=False, index=True)
+    ended_at = db.Column(db.DateTime)
+    agent_count = db.Column(db.Integer)
+    pattern = db.Column(db.String(64), index=True)
+    parameters = db.Column(db.JSON)
+    pattern_durations = db.Column(db.JSON)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'started_at': self.started_at.isoformat(),
+            'ended_at': self.ended_at.isoformat() if self.ended_at else None,
+            'agent_count': self.agent_count,
+            'pattern': self.pattern,
+            'parameters': self.parameters,
+            'pattern_durations': self.pattern_durations
+        }
+
+
+class RunEvent(db.Model):
+    __tablename__ = 'run_events'
+    __table_args__ = (db.Index('ix_run_events_run_time', 'run_id', 'recorded_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(32), nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False)
+    kind = db.Column(db.String(32), nullable=False, index=True)
+    data = db.Column(db.JSON)
+
+    def to_dict(self):
+        return {
+            'recorded_at': self.recorded_at.isoformat(),
+            'kind': self.kind,
+            'data': self.data
+        }
+
+
+class AnalyticsSample(db.Model):
+    __tablename__ = 'analytics_samples'
+    __table_args__ = (db.Index('ix_analytics_samples_run_tick', 'run_id', 'tick'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(32), nullable=False)
+    tick = db.Column(db.Integer, nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False)
+    pattern = db.Column(db.String(64))
+    avg_distance = db.Column(db.Float)
+    cohesion_score = db.Column(db.Float)
+    alignment_score = db.Column(db.Float)
+    pattern_switches = db.Column(db.Integer)
+    role_counts = db.Column(db.JSON)
+    interaction_zones = db.Column(db.JSON)
+
+    def to_dict(self):
+        return {
+            'tick': self.tick,
+            'recorded_at': self.recorded_at.isoformat(),
+            'pattern': self.pattern,
+            'avg_distance': self.avg_distance,
+            'cohesion_score': self.cohesion_score,
+            'alignment_score': self.alignment_score,
+            'pattern_switches': self.pattern_switches,
+            'role_counts': self.role_counts,
+            'interaction_zones': self.interaction_zones
+        }
+
+
+class BoundedBuffer:
+    """Bounded FIFO with an overflow policy.
+
+    drop_oldest - discard the oldest item to make room (never waits)
+    drop_newest - discard the incoming item (never waits)
+    block       - wait up to timeout for room (backpressure), then drop the incoming item;
+                  only for producers that may wait, never the simulation thread
+    """
+    POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, maxsize: int, policy: str = 'drop_oldest', timeout: float = 0.05):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.timeout = timeout
+        self.dropped = 0
+        self._items = deque()
+        self._not_full = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, item) -> bool:
+        with self._not_full:
+            if len(self._items) >= self.maxsize:
+                if self.policy == 'drop_oldest':
+                    self._items.popleft()
+                    self.dropped += 1
+                elif self.policy == 'drop_newest' or not self._not_full.wait_for(
+                        lambda: len(self._items) < self.maxsize, self.timeout):
+                    self.dropped += 1
+                    return False
+            self._items.append(item)
+            return True
+
+    def requeue(self, items: List) -> int:
+        """Put items taken by drain back at the front without waiting.
+
+        If they no longer fit, drop_oldest discards the oldest of them and
+        the other policies discard the newest queued items. Returns the
+        number of items dropped.
+        """
+        with self._not_full:
+            self._items.extendleft(reversed(items))
+            overflow = max(0, len(self._items) - self.maxsize)
+            for _ in range(overflow):
+                if self.policy == 'drop_oldest':
+                    self._items.popleft()
+                else:
+                    self._items.pop()
+            self.dropped += overflow
+            return overflow
+
+    def drain(self, limit: int) -> List:
+        with self._not_full:
+            count = min(limit, len(self._items))
+            items = [self._items.popleft() for _ in range(count)]
+            if items:
+                self._not_full.notify_all()
+            return items
+
+
+class WriteBehindWriter(threading.Thread):
+    """Buffers simulation events in memory and flushes them in batches"""
+
+    def __init__(self, app, batch_size: int = 500, flush_interval: float = 1.0,
+                 sample_queue_size: int = 10000, event_queue_size: int = 10000,
+                 sample_policy: str = 'drop_oldest', event_policy: str = 'drop_newest',
+                 min_backoff: float = 1.0, max_backoff: float = 30.0):
+        super().__init__(daemon=True)
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.samples = BoundedBuffer(sample_queue_size, sample_policy)
+        self.events = BoundedBuffer(event_queue_size, event_policy)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.written = 0
+        self.failed = 0
+        self.failed_flushes = 0
+        self.backoff = 0.0
+        self.last_flush_ms = 0.0
+        self._wake = threading.Event()
+
+    def handle_event(self, run_id: str, kind: str, data: Dict):
+        """Event sink for SwarmSimulation; only touches in-memory buffers.
+
+        Runs on the simulation thread, so neither buffer may use the block
+        policy here. Events default to drop_newest, which keeps each run's
+        run_started record when the database is down for long.
+        """
+        item = (run_id, time.time(), kind, data)
+        buffer = self.samples if kind == 'analytics' else self.events
+        buffer.put(item)
+        if len(buffer) >= self.batch_size:
+            self._wake.set()
+
+    def stats(self) -> Dict:
+        return {
+            'queued_samples': len(self.samples),
+            'queued_events': len(self.events),
+            'dropped_samples': self.samples.dropped,
+            'dropped_events': self.events.dropped,
+            'written': self.written,
+            'failed': self.failed,
+            'failed_flushes': self.failed_flushes,
+            'backoff_s': self.backoff,
+            'last_flush_ms': round(self.last_flush_ms, 2)
+        }
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                if self.backoff:
+                    # Full batches must not cut a retry delay short
+                    time.sleep(self.backoff)
+                else:
+                    self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self.flush()
+
+    def flush(self) -> bool:
+        """Write everything currently buffered; must run inside an app context.
+
+        Returns False if the database was unavailable; the unwritten batch is
+        requeued and self.backoff says how long to wait before trying again.
+        """
+        while len(self.events) or len(self.samples):
+            events = self.events.drain(self.batch_size)
+            samples = self.samples.drain(self.batch_size)
+            started = time.perf_counter()
+            try:
+                self._write_batch(events, samples)
+                db.session.commit()
+                self.written += len(events) + len(samples)
+                self.backoff = 0.0
+            except (OperationalError, InterfaceError) as e:
+                db.session.rollback()
+                self.failed_flushes += 1
+                self.events.requeue(events)
+                self.samples.requeue(samples)
+                self.backoff = min(self.max_backoff, self.backoff * 2 or self.min_backoff)
+                logger.error(f"Database unavailable, retrying {len(events) + len(samples)} "
+                             f"records in {self.backoff:.0f}s: {e}")
+                return False
+            except Exception as e:
+                # Anything else (constraint or data errors) would fail again on retry
+                db.session.rollback()
+                self.failed_flushes += 1
+                self.failed += len(events) + len(samples)
+                logger.error(f"Failed to persist {len(events) + len(samples)} records: {e}")
+            finally:
+                self.last_flush_ms = (time.perf_counter() - started) * 1000
+        return True
+
+    def _write_batch(self, events: List, samples: List):
+        # Runs first so that run_ended updates and queries always find them;
+        # a restored checkpoint re-announces a run that may already exist.
+        started = [(run_id, ts, data) for run_id, ts, kind, data in events if kind == 'run_started']
+        if started:
+            existing = set(db.session.scalars(
+                select(Run.id).where(Run.id.in_([run_id for run_id, _, _ in started]))))
+            rows = [{
+                'id': run_id,
+                'started_at': _utc(ts),
+                'agent_count': data.get('agent_count'),
+                'pattern': data.get('pattern'),
+                'parameters': data.get('parameters')
+            } for run_id, ts, data in started if run_id not in existing]
+            if rows:
+                db.session.execute(insert(Run), rows)
+
+        for run_id, ts, kind, data in events:
+            if kind == 'run_ended':
+                run = db.session.get(Run, run_id)
+                if run is not None:
+                    run.ended_at = _utc(ts)
+                    run.pattern_durations = data.get('pattern_durations')
+
+        if events:
+            db.session.execute(insert(RunEvent), [{
+                'run_id': run_id,
+                'recorded_at': _utc(ts),
+                'kind': kind,
+                'data': data
+            } for run_id, ts, kind, data in events])
+
+        if samples:
+            db.session.execute(insert(AnalyticsSample), [{
+                'run_id': run_id,
+                'tick': data['tick'],
+                'recorded_at': _utc(ts),
+                'pattern': data.get('pattern'),
+                'avg_distance': data.get('avg_distance'),
+                'cohesion_score': data.get('cohesion_score'),
+                'alignment_score': data.get('alignment_score'),
+                'pattern_switches': data.get('pattern_switches'),
+                'role_counts': data.get('role_counts'),
+                'interaction_zones': data.get('interaction_zones')
+            } for run_id, ts, kind, data in samples])
+
+
+def recent_runs(limit: int = 50, pattern: Optional[str] = None) -> List[Dict]:
+    """Most recent runs first, optionally filtered by starting pattern"""
+    query = select(Run).order_by(Run.started_at.desc()).limit(limit)
+    if pattern:
+        query = query.where(Run.pattern == pattern)
+    return [run.to_dict() for run in db.session.scalars(query)]
+
+
+def run_details(run_id: str, since_tick: int = 0, limit: int = 5000) -> Optional[Dict]:
+    """A run with its events and analytics samples from since_tick onwards"""
+    run = db.session.get(Run, run_id)
+    if run is None:
+        return None
+    events = db.session.scalars(
+        select(RunEvent).where(RunEvent.run_id == run_id).order_by(RunEvent.recorded_at))
+    samples = db.session.scalars(
+        select(AnalyticsSample)
+        .where(AnalyticsSample.run_id == run_id, AnalyticsSample.tick >= since_tick)
+        .order_by(AnalyticsSample.tick)
+        .limit(limit))
+    return dict(run.to_dict(),
+                events=[e.to_dict() for e in events],
+                samples=[s.to_dict() for s in samples])
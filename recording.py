@@ -0,0 +1,264 @@
+"""Compact chunked recording format and on-disk upload spool.
+
+A recording stream is a sequence of self-delimiting chunks:
+
+    b'SWRC' | u32 first frame | u32 frame count | u32 payload length | payload
+
+where the payload is the zlib-compressed concatenation of one float32 column
+block per frame (see checkpoint.pack_states). Chunks can be produced, sent,
+received and decoded one at a time, so neither end of a transfer needs more
+than a single chunk in memory, and a transfer can resume from any chunk
+boundary by frame number.
+"""
+import fcntl
+import logging
+import os
+import re
+import struct
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from checkpoint import pack_states, unpack_states
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SWRC'
+CHUNK_HEADER = struct.Struct('<4sIII')
+CHUNK_FRAMES = 60  # two seconds of 30 FPS playback per chunk
+MAX_CHUNK_BYTES = 16 * 1024 * 1024
+MAX_FRAME_AGENTS = 100000
+# Decoded size of one float32 frame block of MAX_FRAME_AGENTS agents
+MAX_FRAME_BYTES = 4 + 14 * MAX_FRAME_AGENTS
+MAX_DECODED_CHUNK_BYTES = 256 * 1024 * 1024
+UPLOAD_TTL = 60 * 60  # seconds an upload may sit idle before it is purged
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class RecordingError(ValueError):
+    """Raised for malformed chunks or out-of-order uploads"""
+
+
+def encode_chunk(first_frame: int, frames: List[List[Dict]]) -> bytes:
+    """Encode frames as one compressed chunk starting at first_frame"""
+    payload = zlib.compress(b''.join(pack_states(frame) for frame in frames))
+    return CHUNK_HEADER.pack(MAGIC, first_frame, len(frames), len(payload)) + payload
+
+
+def parse_chunk_header(data: bytes) -> Tuple[int, int, int]:
+    """Return (first_frame, frame_count, payload_length) of a chunk header"""
+    if len(data) < CHUNK_HEADER.size:
+        raise RecordingError("Truncated chunk header")
+    magic, first_frame, count, length = CHUNK_HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise RecordingError("Not a recording chunk")
+    if length > MAX_CHUNK_BYTES:
+        raise RecordingError(f"Chunk payload too large ({length} bytes)")
+    return first_frame, count, length
+
+
+def decode_chunk(data: bytes) -> Tuple[int, List[List[Dict]]]:
+    """Decode one chunk into (first_frame, frames)"""
+    first_frame, count, length = parse_chunk_header(data)
+    if len(data) != CHUNK_HEADER.size + length:
+        raise RecordingError("Chunk length does not match its header")
+    # Bound the decompressed size by what count frames can legitimately
+    # occupy, so a small hostile payload cannot expand without limit.
+    limit = max(1, min(count * MAX_FRAME_BYTES, MAX_DECODED_CHUNK_BYTES))
+    decompressor = zlib.decompressobj()
+    try:
+        payload = decompressor.decompress(data[CHUNK_HEADER.size:], limit)
+    except zlib.error as e:
+        raise RecordingError(f"Corrupt chunk payload: {e}")
+    if decompressor.unconsumed_tail:
+        raise RecordingError(f"Chunk payload expands beyond {limit} bytes")
+    if not decompressor.eof:
+        raise RecordingError("Truncated chunk payload")
+    frames = []
+    offset = 0
+    try:
+        for _ in range(count):
+            frame, offset = unpack_states(payload, offset)
+            frames.append(frame)
+    except (struct.error, IndexError, ValueError) as e:
+        raise RecordingError(f"Malformed chunk frames: {e}")
+    if offset != len(payload):
+        raise RecordingError("Chunk payload has trailing bytes")
+    return first_frame, frames
+
+
+def iter_chunks(states: List[List[Dict]], start: int = 0, end: Optional[int] = None,
+                chunk_frames: int = CHUNK_FRAMES) -> Iterator[bytes]:
+    """Lazily encode states[start:end] as chunks, one chunk at a time"""
+    end = len(states) if end is None else min(end, len(states))
+    for first in range(start, end, chunk_frames):
+        yield encode_chunk(first, states[first:min(first + chunk_frames, end)])
+
+
+def parse_frame_range(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """Parse a 'frames=a-b' Range header into a half-open [start, end) frame range"""
+    if not header:
+        return None
+    match = re.fullmatch(r'\s*frames=(\d*)-(\d*)\s*', header)
+    if not match or match.group(1) == match.group(2) == '':
+        raise RecordingError(f"Unsupported range: {header}")
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N frames
+        if int(last) == 0 or total == 0:
+            raise RecordingError(f"Range not satisfiable: {header}")
+        return max(0, total - int(last)), total
+    start = int(first)
+    end = total if last == '' else min(total, int(last) + 1)
+    if start >= total or start >= end:
+        raise RecordingError(f"Range not satisfiable: {header}")
+    return start, end
+
+
+class UploadSpool:
+    """Spools chunked recording uploads to disk, one file per upload.
+
+    An upload is removed once playback takes it, or after it has been idle
+    for ttl seconds. Appends hold an exclusive flock on the upload file, so
+    concurrent PUTs from any worker process are applied one at a time.
+    """
+
+    def __init__(self, directory: str, ttl: float = UPLOAD_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def create(self) -> str:
+        self.purge_expired()
+        upload_id = uuid.uuid4().hex
+        open(self.path(upload_id), 'wb').close()
+        logger.info(f"Created recording upload {upload_id}")
+        return upload_id
+
+    def purge_expired(self) -> int:
+        """Delete uploads not written to for ttl seconds; returns how many"""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.swrec'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"Purged {removed} expired recording uploads")
+        return removed
+
+    def path(self, upload_id: str) -> str:
+        if not _UPLOAD_ID.match(upload_id):
+            raise RecordingError(f"Invalid upload id: {upload_id}")
+        return os.path.join(self.directory, f"{upload_id}.swrec")
+
+    def exists(self, upload_id: str) -> bool:
+        return os.path.exists(self.path(upload_id))
+
+    def frame_count(self, upload_id: str) -> int:
+        """Number of frames committed so far, used by clients to resume"""
+        recording = SpooledRecording(self.path(upload_id))
+        recording.close()
+        return recording.frame_count
+
+    @contextmanager
+    def _locked(self, upload_id: str):
+        # O_APPEND without O_CREAT: an upload that was taken or purged
+        # raises FileNotFoundError rather than being silently recreated.
+        fd = os.open(self.path(upload_id), os.O_WRONLY | os.O_APPEND)
+        with os.fdopen(fd, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield f
+
+    def append(self, upload_id: str, chunk: bytes) -> int:
+        """Append one chunk; chunks already received are ignored so retries are safe"""
+        first_frame, frames = decode_chunk(chunk)
+        with self._locked(upload_id) as f:
+            committed = self.frame_count(upload_id)
+            if first_frame + len(frames) <= committed:
+                return committed
+            if first_frame != committed:
+                raise RecordingError(f"Expected chunk starting at frame {committed}, got {first_frame}")
+            f.write(chunk)
+        return committed + len(frames)
+
+    def take(self, upload_id: str) -> 'SpooledRecording':
+        """Open a finished upload for playback and remove it from the spool.
+
+        The returned recording keeps the file open, so it stays readable
+        after the spool entry is deleted.
+        """
+        with self._locked(upload_id):
+            recording = SpooledRecording(self.path(upload_id))
+            os.unlink(recording.path)
+        logger.info(f"Took recording upload {upload_id} ({recording.frame_count} frames)")
+        return recording
+
+
+class SpooledRecording:
+    """Read-only, disk-backed sequence of recorded frames.
+
+    Supports len() and indexing like the in-memory recorded_states list so it
+    can be handed to SwarmSimulation.load_recording; only the chunk holding
+    the most recently accessed frame is kept decoded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._index: List[Tuple[int, int, int]] = []  # (first frame, count, file offset)
+        self.frame_count = 0
+        self._cached_first = -1
+        self._cached_frames: List[List[Dict]] = []
+        try:
+            self._scan()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self._file.close()
+
+    def _scan(self):
+        f = self._file
+        offset = 0
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                break
+            first_frame, count, length = parse_chunk_header(header)
+            self._index.append((first_frame, count, offset))
+            offset += CHUNK_HEADER.size + length
+            f.seek(offset)
+        if self._index:
+            first_frame, count, _ = self._index[-1]
+            self.frame_count = first_frame + count
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def __getitem__(self, index: int) -> List[Dict]:
+        if not 0 <= index < self.frame_count:
+            raise IndexError(index)
+        if not self._cached_first <= index < self._cached_first + len(self._cached_frames):
+            self._load_chunk_for(index)
+        return self._cached_frames[index - self._cached_first]
+
+    def _load_chunk_for(self, index: int):
+        for first_frame, count, offset in self._index:
+            if first_frame <= index < first_frame + count:
+                break
+        f = self._file
+        f.seek(offset)
+        _, _, length = parse_chunk_header(f.read(CHUNK_HEADER.size))
+        f.seek(offset)
+        self._cached_first, self._cached_frames = decode_chunk(f.read(CHUNK_HEADER.size + length))
@@ -0,0 +1,311 @@
+"""Local pub/sub relay between the simulation host and WebSocket front ends.
+
+The host publishes every encoded state frame on a Unix socket and accepts
+control messages from any number of front-end worker processes, which in
+turn serve the browsers. Messages on the socket are length prefixed:
+
+    u32 length | 1 byte kind | payload
+
+with kind F (state frame, the JSON text sent to browsers), C (command from a
+front end: {"client": id, "message": ...}) or R (reply routed back to one
+client: {"client": id, "message": ...}).
+
+Each subscriber only ever has the latest frame pending, so a slow front end
+skips frames instead of building an unbounded backlog on the host.
+Recording downloads are not relayed: front ends proxy GET /recording to the
+host's HTTP port (SWARM_HOST_URL), streaming it through chunk by chunk.
+
+    SWARM_ROLE=host python main.py
+    SWARM_ROLE=frontend gunicorn -w 4 --threads 64 -b 0.0.0.0:8000 wsgi:app
+"""
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+FRAME = b'F'
+COMMAND = b'C'
+REPLY = b'R'
+
+_HEADER = struct.Struct('<Ic')
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+def _fits(payload: bytes) -> bool:
+    """Whether payload can be sent; oversized messages are dropped, not sent"""
+    if len(payload) > MAX_MESSAGE_BYTES:
+        logger.warning(f"Dropping relay message of {len(payload)} bytes (limit {MAX_MESSAGE_BYTES})")
+        return False
+    return True
+
+
+def _send_message(sock: socket.socket, kind: bytes, payload: bytes):
+    sock.sendall(_HEADER.pack(len(payload), kind) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    parts = []
+    while size:
+        part = sock.recv(min(size, 1 << 20))
+        if not part:
+            return None
+        parts.append(part)
+        size -= len(part)
+    return b''.join(parts)
+
+
+def _discard_exact(sock: socket.socket, size: int) -> bool:
+    while size:
+        part = sock.recv(min(size, 1 << 20))
+        if not part:
+            return False
+        size -= len(part)
+    return True
+
+
+def _recv_message(sock: socket.socket):
+    """Read one (kind, payload) message, or None when the peer has gone.
+
+    An oversized message is read off the socket and discarded, keeping the
+    connection usable; it is returned with a payload of None.
+    """
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    length, kind = _HEADER.unpack(header)
+    if length > MAX_MESSAGE_BYTES:
+        logger.warning(f"Skipping relay message of {length} bytes (limit {MAX_MESSAGE_BYTES})")
+        return (kind, None) if _discard_exact(sock, length) else None
+    payload = _recv_exact(sock, length)
+    if payload is None:
+        return None
+    return kind, payload
+
+
+class _Subscriber:
+    """Host-side connection to one front end"""
+
+    def __init__(self, conn: socket.socket, publisher: 'FramePublisher'):
+        self.conn = conn
+        self.publisher = publisher
+        self.frame: Optional[bytes] = None
+        self.replies = deque()
+        self.dropped_frames = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self._send_loop, daemon=True).start()
+        threading.Thread(target=self._receive_loop, daemon=True).start()
+
+    def offer_frame(self, frame: bytes):
+        with self.cond:
+            if self.frame is not None:
+                self.dropped_frames += 1
+            self.frame = frame
+            self.cond.notify()
+
+    def reply(self, client_id: int, message: Dict):
+        payload = json.dumps({'client': client_id, 'message': message}).encode('utf-8')
+        if not _fits(payload):
+            payload = json.dumps({'client': client_id, 'message': {
+                'type': 'error', 'message': 'Reply too large to relay'}}).encode('utf-8')
+        with self.cond:
+            self.replies.append(payload)
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify()
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        self.publisher._remove(self)
+
+    def _send_loop(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.closed and self.frame is None and not self.replies:
+                        self.cond.wait()
+                    if self.closed:
+                        return
+                    if self.replies:
+                        kind, payload = REPLY, self.replies.popleft()
+                    else:
+                        kind, payload = FRAME, self.frame
+                        self.frame = None
+                _send_message(self.conn, kind, payload)
+        except OSError as e:
+            logger.warning(f"Relay subscriber send failed: {e}")
+        finally:
+            self.close()
+
+    def _receive_loop(self):
+        try:
+            while True:
+                message = _recv_message(self.conn)
+                if message is None:
+                    break
+                kind, payload = message
+                if kind != COMMAND or payload is None:
+                    continue
+                envelope = json.loads(payload)
+                client_id = envelope['client']
+                try:
+                    self.publisher.on_command(envelope['message'],
+                                              lambda reply, cid=client_id: self.reply(cid, reply))
+                except Exception as e:
+                    logger.error(f"Error handling relayed command: {e}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Relay subscriber receive failed: {e}")
+        finally:
+            self.close()
+
+
+class FramePublisher:
+    """Host side: publishes frames to, and takes commands from, front ends"""
+
+    def __init__(self, path: str, on_command: Callable[[Dict, Callable[[Dict], None]], None]):
+        self.path = path
+        self.on_command = on_command
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._server: Optional[socket.socket] = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            # Only clear a stale socket; never take over a live host's
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise RuntimeError(f"Another host is already publishing on {self.path}")
+            finally:
+                probe.close()
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        logger.info(f"Relay publishing on {self.path}")
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError as e:
+                logger.error(f"Relay accept failed: {e}")
+                return
+            subscriber = _Subscriber(conn, self)
+            with self._lock:
+                self._subscribers.add(subscriber)
+            subscriber.start()
+            logger.info(f"Relay subscriber connected. Total subscribers: {self.subscriber_count}")
+
+    def _remove(self, subscriber: _Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        logger.info(f"Relay subscriber disconnected. Remaining subscribers: {self.subscriber_count}")
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, frame: str):
+        """Offer an encoded frame to every subscriber without blocking"""
+        payload = frame.encode('utf-8')
+        if not _fits(payload):
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.offer_frame(payload)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'dropped_frames': sum(s.dropped_frames for s in subscribers)
+        }
+
+
+class FrameSubscriber(threading.Thread):
+    """Front-end side: receives frames and replies, forwards commands to the host"""
+
+    def __init__(self, path: str, on_frame: Callable[[str], None],
+                 on_reply: Callable[[int, Dict], None], retry_interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.path = path
+        self.on_frame = on_frame
+        self.on_reply = on_reply
+        self.retry_interval = retry_interval
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def send_command(self, client_id: int, message: Dict) -> bool:
+        """Forward a client's control message to the host"""
+        sock = self._sock
+        if sock is None:
+            logger.warning("Relay not connected, command dropped")
+            return False
+        payload = json.dumps({'client': client_id, 'message': message}).encode('utf-8')
+        if not _fits(payload):
+            return False
+        try:
+            with self._send_lock:
+                _send_message(sock, COMMAND, payload)
+            return True
+        except OSError as e:
+            logger.warning(f"Failed to forward command to host: {e}")
+            return False
+
+    def run(self):
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+            except OSError as e:
+                logger.debug(f"Relay host not reachable at {self.path}: {e}")
+                time.sleep(self.retry_interval)
+                continue
+
+            self._sock = sock
+            logger.info(f"Subscribed to relay at {self.path}")
+            try:
+                while True:
+                    message = _recv_message(sock)
+                    if message is None:
+                        break
+                    kind, payload = message
+                    if payload is None:
+                        continue
+                    if kind == FRAME:
+                        self.on_frame(payload.decode('utf-8'))
+                    elif kind == REPLY:
+                        envelope = json.loads(payload)
+                        self.on_reply(envelope['client'], envelope['message'])
+            except (OSError, ValueError) as e:
+                logger.warning(f"Relay connection error: {e}")
+            finally:
+                self._sock = None
+                sock.close()
+            logger.warning("Relay host disconnected, reconnecting")
+            time.sleep(self.retry_interval)
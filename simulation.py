@@ -3,10 +3,14 @@ import time
 import threading
 import random
 import json
+import uuid
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Dict, Optional, Tuple
 
+from multirate import MultiRateScheduler
+from commands import CommandQueue
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG,
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -21,6 +25,9 @@ class Agent:
     vy: float = 0
     role: str = 'normal'  # Can be 'normal', 'predator', or 'prey'
     state: str = 'normal'  # Added state field for tracking organization status
+    # Multi-rate stepping bookkeeping (tick of the last/next full update)
+    last_update: int = field(default=-1, compare=False, repr=False)
+    next_update: int = field(default=0, compare=False, repr=False)
     
     def to_dict(self):
         return {
@@ -69,8 +76,10 @@ class SwarmSimulation:
     ORGANIZATION_THRESHOLD = 0.4  # 40% of total agents needed for organization
     CONVERSION_RADIUS = 50.0  # Distance for converting normal agents to prey
     FLEE_DISTANCE = 200.0  # Distance at which predators flee from organized prey
+    ANALYTICS_SAMPLE_INTERVAL = 30  # Ticks between analytics samples passed to the event sink
     
-    def __init__(self):
+    def __init__(self, run_loop: bool = True):
+        """Create a simulation; run_loop=False leaves stepping to the caller (offline tools)"""
         self.agents: List[Agent] = []
         self.running = False
         self.parameters = {
@@ -79,31 +88,41 @@ class SwarmSimulation:
             'swarmCohesion': 5,
             'swarmAlignment': 5,
             'waveFrequency': 0.5,
-            'waveAmplitude': 50
+            'waveAmplitude': 50,
+            'multiRateQuality': 1.0  # 1.0 = update every agent every tick
         }
         self.current_pattern = 'flocking'
         self.formation_center = {'x': 400.0, 'y': 300.0}
         self._initialize_simulation()
 
+        self.thread = None
+        if run_loop:
+            # Start simulation thread
+            self.thread = threading.Thread(target=self._simulation_loop)
+            self.thread.daemon = True
+            self.thread.start()
+            logger.info("Simulation thread started")
+
     def _initialize_simulation(self):
         """Initialize simulation components"""
         self.time_accumulated = 0
+        self.tick = 0
+        self.tick_time = time.time()
         self.last_pattern_change = time.time()
         self.analytics = SwarmAnalytics()
+        self.scheduler = MultiRateScheduler()
         self.recording = False
         self.recorded_states = []
+        self.recording_id = uuid.uuid4().hex  # Identifies recorded_states, e.g. as an HTTP ETag
         self.playback_mode = False
         self.playback_index = 0
         self.playback_states = []
+        self.commands = CommandQueue()
+        self.run_id = None
+        self.event_sink = None  # Optional callable(run_id, kind, data) for run events
         
         self.reset()
         logger.info("SwarmSimulation initialized")
-        
-        # Start simulation thread
-        self.thread = threading.Thread(target=self._simulation_loop)
-        self.thread.daemon = True
-        self.thread.start()
-        logger.info("Simulation thread started")
 
     def set_parameter(self, name: str, value: float) -> bool:
         """Update simulation parameter with basic type conversion"""
@@ -120,8 +139,34 @@ class SwarmSimulation:
             logger.error(f"Error setting parameter {name}: {e}")
             return False
 
+    def run_info(self) -> Dict:
+        """Metadata describing the current run"""
+        return {
+            'agent_count': len(self.agents),
+            'pattern': self.current_pattern,
+            'parameters': dict(self.parameters)
+        }
+
+    def _pattern_durations(self) -> Dict[str, float]:
+        """Pattern durations including the time spent in the current pattern"""
+        durations = dict(self.analytics.pattern_durations)
+        durations[self.current_pattern] = \
+            durations.get(self.current_pattern, 0) + time.time() - self.last_pattern_change
+        return durations
+
+    def _emit(self, kind: str, data: Dict):
+        """Pass a run event to the event sink, if one is attached"""
+        if self.event_sink is None:
+            return
+        try:
+            self.event_sink(self.run_id, kind, data)
+        except Exception as e:
+            logger.error(f"Error in event sink for {kind}: {e}")
+
     def reset(self):
         """Reset simulation with current parameters"""
+        if self.run_id is not None:
+            self._emit('run_ended', {'pattern_durations': self._pattern_durations()})
         self.agents = []
         agent_count = self.parameters['agentCount']
         logger.debug(f"Resetting simulation with {agent_count} agents")
@@ -160,21 +205,27 @@ class SwarmSimulation:
         self.stop_recording()
         self.stop_playback()
         self.analytics.reset_metrics()
+        self.last_pattern_change = time.time()
+        self.run_id = uuid.uuid4().hex
+        self._emit('run_started', self.run_info())
 
     def start(self):
         """Start simulation"""
         self.running = True
+        self._emit('started', {'tick': self.tick})
         logger.info("Simulation started")
 
     def stop(self):
         """Stop simulation"""
         self.running = False
+        self._emit('stopped', {'tick': self.tick})
         logger.info("Simulation stopped")
 
     def start_recording(self):
         """Start recording agent states"""
         if not self.playback_mode:
             self.recording = True
+            self.recording_id = uuid.uuid4().hex
             self.recorded_states = []
             logger.info("Recording started")
 
@@ -215,8 +266,14 @@ class SwarmSimulation:
             self.analytics.pattern_durations[self.current_pattern] = \
                 self.analytics.pattern_durations.get(self.current_pattern, 0) + duration
             self.last_pattern_change = current_time
+            self._emit('pattern_changed', {
+                'from': self.current_pattern,
+                'to': pattern,
+                'duration': duration
+            })
             
         self.current_pattern = pattern
+        self.scheduler.reset(self.agents)
         logger.info(f"Pattern changed to {pattern}")
 
     def get_analytics(self) -> Dict:
@@ -255,11 +312,16 @@ class SwarmSimulation:
                     self.time_accumulated += dt
                     self._update(dt)
                     self._update_analytics()
+                    if self.event_sink and self.tick % self.ANALYTICS_SAMPLE_INTERVAL == 0:
+                        self._emit('analytics', dict(self.get_analytics(), tick=self.tick,
+                                                     pattern=self.current_pattern))
                     
                     # Record state if recording is enabled
                     if self.recording:
                         self.recorded_states.append(self.get_agent_states())
                 
+                self.tick += 1
+                self.tick_time = time.time()
                 updates_count += 1
                 if updates_count % 100 == 0:
                     logger.debug(f"Simulation running: {updates_count} updates completed")
@@ -267,6 +329,7 @@ class SwarmSimulation:
                         agent = self.agents[0]
                         logger.debug(f"Sample agent position: x={agent.x:.2f}, y={agent.y:.2f}, angle={agent.angle:.2f}")
                         
+            self.commands.drain(self.tick)
             time.sleep(1/60)  # 60 FPS target
 
     def _update(self, dt: float):
@@ -275,6 +338,8 @@ class SwarmSimulation:
         speed = base_speed * 4.0 * dt
         cohesion = self.parameters['swarmCohesion'] * 0.02
         alignment = self.parameters['swarmAlignment'] * 0.02
+        self.scheduler.quality = self.parameters['multiRateQuality']
+        self.scheduler.begin_tick()
 
         if self.current_pattern == 'predator_prey':
             self._update_predator_prey(speed, dt)
@@ -336,23 +401,26 @@ class SwarmSimulation:
             # Arrange prey in arrow formation
             formation_radius = 30 + num_prey * 2
             for idx, agent in enumerate(prey_agents):
-                angle = (2 * math.pi * idx) / num_prey
-                # Create arrow shape
-                if abs(angle - math.pi) < math.pi/3:
-                    radius = formation_radius * 0.7  # Front of arrow
-                else:
-                    radius = formation_radius  # Wings
-                
-                desired_x = self.formation_center['x'] + radius * math.cos(angle)
-                desired_y = self.formation_center['y'] + radius * math.sin(angle)
-                
-                dx = desired_x - agent.x
-                dy = desired_y - agent.y
-                target_angle = math.atan2(dy, dx)
-                
-                # Smooth angle adjustment
-                angle_diff = (target_angle - agent.angle + math.pi) % (2 * math.pi) - math.pi
-                agent.angle += angle_diff * 0.1
+                steps = self.scheduler.due(agent)
+                if steps:
+                    angle = (2 * math.pi * idx) / num_prey
+                    # Create arrow shape
+                    if abs(angle - math.pi) < math.pi/3:
+                        radius = formation_radius * 0.7  # Front of arrow
+                    else:
+                        radius = formation_radius  # Wings
+                    
+                    desired_x = self.formation_center['x'] + radius * math.cos(angle)
+                    desired_y = self.formation_center['y'] + radius * math.sin(angle)
+                    
+                    dx = desired_x - agent.x
+                    dy = desired_y - agent.y
+                    target_angle = math.atan2(dy, dx)
+                    
+                    # Smooth angle adjustment
+                    angle_diff = (target_angle - agent.angle + math.pi) % (2 * math.pi) - math.pi
+                    agent.angle += angle_diff * self.scheduler.gain(0.1, steps)
+                    self.scheduler.schedule(agent, self.scheduler.stride_for_error(abs(angle_diff)))
                 
                 # Move agent
                 agent.x += math.cos(agent.angle) * speed * 1.2
@@ -423,6 +491,13 @@ class SwarmSimulation:
                     agent.y += math.sin(agent.angle) * speed * 1.2
             
             elif agent.role == 'prey':
+                # Prey far from every predator only re-check every few ticks;
+                # until then they keep their normal movement.
+                if not self.scheduler.due(agent):
+                    agent.x += math.cos(agent.angle) * speed
+                    agent.y += math.sin(agent.angle) * speed
+                    continue
+
                 # Prey flee from closest predator
                 closest_predator = None
                 min_dist = float('inf')
@@ -438,35 +513,47 @@ class SwarmSimulation:
                     agent.angle += 0.1 * math.sin(flee_angle - agent.angle)
                     agent.x += math.cos(agent.angle) * speed * 1.1  # Prey slightly faster than normal
                     agent.y += math.sin(agent.angle) * speed * 1.1
+                    self.scheduler.schedule(agent, 1)
                 else:
                     # Normal movement if no predator nearby
                     agent.x += math.cos(agent.angle) * speed
                     agent.y += math.sin(agent.angle) * speed
+                    # Predator (1.2x) and prey (1x) close the gap by at most 2.2x speed per tick
+                    self.scheduler.schedule(agent, self.scheduler.stride_for_clearance(
+                        min_dist - 200, speed * 2.2))
             
             else:  # Normal agents
                 agent.x += math.cos(agent.angle) * speed
                 agent.y += math.sin(agent.angle) * speed
-                agent.angle += random.uniform(-0.1, 0.1)
+                steps = self.scheduler.due(agent)
+                if steps:
+                    # Random walk: jitter variance grows linearly with skipped ticks
+                    agent.angle += random.uniform(-0.1, 0.1) * math.sqrt(steps)
+                    self.scheduler.schedule(agent, self.scheduler.max_stride)
 
     def _update_vortex(self, speed: float, dt: float):
         """Vortex pattern - spiral formation"""
         center_x, center_y = 400, 300
         for agent in self.agents:
-            # Calculate distance from center
-            dx = agent.x - center_x
-            dy = agent.y - center_y
-            distance = math.sqrt(dx*dx + dy*dy)
-            
-            # Calculate tangential and radial components
-            current_angle = math.atan2(dy, dx)
-            spiral_factor = 0.1  # Controls how tight the spiral is
-            
-            # Adjust angle based on distance (closer = faster rotation)
-            rotation_speed = 2.0 / (distance + 50)  # Prevent division by zero
-            target_angle = current_angle + math.pi/2 + spiral_factor
-            
-            # Smoothly adjust to target angle
-            agent.angle += 0.1 * math.sin(target_angle - agent.angle)
+            steps = self.scheduler.due(agent)
+            if steps:
+                # Calculate distance from center
+                dx = agent.x - center_x
+                dy = agent.y - center_y
+                distance = math.sqrt(dx*dx + dy*dy)
+                
+                # Calculate tangential and radial components
+                current_angle = math.atan2(dy, dx)
+                spiral_factor = 0.1  # Controls how tight the spiral is
+                
+                # Adjust angle based on distance (closer = faster rotation)
+                rotation_speed = 2.0 / (distance + 50)  # Prevent division by zero
+                target_angle = current_angle + math.pi/2 + spiral_factor
+                
+                # Smoothly adjust to target angle
+                error = math.sin(target_angle - agent.angle)
+                agent.angle += self.scheduler.gain(0.1, steps) * error
+                self.scheduler.schedule(agent, self.scheduler.stride_for_error(abs(error)))
             
             # Move agent
             agent.x += math.cos(agent.angle) * speed
@@ -610,11 +697,15 @@ class SwarmSimulation:
         """Original circular pattern"""
         center_x, center_y = 400, 300
         for agent in self.agents:
-            target_angle = math.atan2(
-                center_y - agent.y,
-                center_x - agent.x
-            ) + math.pi/2
-            agent.angle += 0.1 * math.sin(target_angle - agent.angle)
+            steps = self.scheduler.due(agent)
+            if steps:
+                target_angle = math.atan2(
+                    center_y - agent.y,
+                    center_x - agent.x
+                ) + math.pi/2
+                error = math.sin(target_angle - agent.angle)
+                agent.angle += self.scheduler.gain(0.1, steps) * error
+                self.scheduler.schedule(agent, self.scheduler.stride_for_error(abs(error)))
             
             agent.x += math.cos(agent.angle) * speed
             agent.y += math.sin(agent.angle) * speed
@@ -28,7 +28,7 @@ class SwarmControls {
         };
 
         document.getElementById('saveRecordingBtn').onclick = () => {
-            window.swarmWS.send({ type: 'get_recording' });
+            this.downloadRecordingStream('/recording');
         };
 
         document.getElementById('loadRecordingBtn').onclick = () => {
@@ -37,7 +37,10 @@ class SwarmControls {
 
         document.getElementById('recordingFileInput').onchange = (event) => {
             const file = event.target.files[0];
-            if (file) {
+            if (file && !file.name.endsWith('.json')) {
+                // Chunked recordings are uploaded lazily when playback starts
+                this.currentRecording = file;
+            } else if (file) {
                 const reader = new FileReader();
                 reader.onload = (e) => {
                     try {
@@ -51,7 +54,15 @@ class SwarmControls {
         };
 
         document.getElementById('startPlaybackBtn').onclick = () => {
-            if (this.currentRecording) {
+            if (this.currentRecording instanceof File) {
+                this.uploadRecording(this.currentRecording)
+                    .then(uploadId => window.swarmWS.send({
+                        type: 'command',
+                        action: 'start_playback',
+                        upload_id: uploadId
+                    }))
+                    .catch(error => console.error('Error uploading recording:', error));
+            } else if (this.currentRecording) {
                 window.swarmWS.send({
                     type: 'command',
                     action: 'start_playback',
@@ -71,7 +82,8 @@ class SwarmControls {
             {id: 'swarmCohesion', valueId: 'cohesionValue', min: 1, max: 10, step: 1},
             {id: 'swarmAlignment', valueId: 'alignmentValue', min: 1, max: 10, step: 1},
             {id: 'waveFrequency', valueId: 'waveFrequencyValue', min: 0.1, max: 2, step: 0.1},
-            {id: 'waveAmplitude', valueId: 'waveAmplitudeValue', min: 10, max: 100, step: 5}
+            {id: 'waveAmplitude', valueId: 'waveAmplitudeValue', min: 10, max: 100, step: 5},
+            {id: 'multiRateQuality', valueId: 'multiRateQualityValue', min: 0, max: 1, step: 0.05}
         ];
         
         parameters.forEach(param => {
@@ -108,7 +120,11 @@ class SwarmControls {
         // Add WebSocket message handler for recording data
         window.swarmWS.onMessage((data) => {
             if (data.type === 'recording_data') {
-                this.downloadRecording(data.recording);
+                if (data.url) {
+                    this.downloadRecordingStream(data.url);
+                } else {
+                    this.downloadRecording(data.recording);
+                }
             }
         });
     }
@@ -121,6 +137,68 @@ class SwarmControls {
         });
     }
 
+    async uploadRecording(file, maxRetries = 5) {
+        // Resume an interrupted upload of this file if the server still has
+        // it; uploads are removed once played back or after sitting idle.
+        let committed = null;
+        if (this.upload && this.upload.file === file) {
+            const status = await fetch(`/recording/uploads/${this.upload.id}`);
+            if (status.ok) {
+                committed = (await status.json()).frames;
+            }
+        }
+        if (committed === null) {
+            const response = await fetch('/recording/uploads', { method: 'POST' });
+            const created = await response.json();
+            this.upload = { file: file, id: created.upload_id };
+            committed = created.frames;
+        }
+        const uploadUrl = `/recording/uploads/${this.upload.id}`;
+
+        // Each chunk starts with 'SWRC', first frame, frame count and payload
+        // length as little-endian u32s; only one chunk is read at a time.
+        let offset = 0;
+        let retries = 0;
+        while (offset < file.size) {
+            const header = new DataView(await file.slice(offset, offset + 16).arrayBuffer());
+            const firstFrame = header.getUint32(4, true);
+            const frameCount = header.getUint32(8, true);
+            const chunkEnd = offset + 16 + header.getUint32(12, true);
+
+            if (firstFrame + frameCount > committed) {
+                const response = await fetch(uploadUrl, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/octet-stream' },
+                    body: file.slice(offset, chunkEnd)
+                });
+                if (!response.ok) {
+                    if (++retries > maxRetries) {
+                        throw new Error(`Upload failed with status ${response.status}`);
+                    }
+                    committed = (await (await fetch(uploadUrl)).json()).frames;
+                    offset = 0;
+                    continue;
+                }
+                committed = (await response.json()).frames;
+            }
+            offset = chunkEnd;
+        }
+        // Playback consumes the upload, so the next playback uploads afresh
+        const uploadId = this.upload.id;
+        this.upload = null;
+        return uploadId;
+    }
+
+    downloadRecordingStream(url) {
+        // Streamed by the server in compressed chunks; the browser writes it straight to disk
+        const a = document.createElement('a');
+        a.href = url;
+        a.download = 'swarm-recording.swrec';
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+    }
+
     downloadRecording(recording) {
         const blob = new Blob([JSON.stringify(recording)], { type: 'application/json' });
         const url = URL.createObjectURL(blob);
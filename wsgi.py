@@ -0,0 +1,4 @@
+"""WSGI entry point for production servers, e.g. gunicorn wsgi:app"""
+from app import app, start_services
+
+start_services()